@@ -121,6 +121,35 @@ cpdef kernel(ptree, counts=None, int max_depth=4, int max_childs=20, double deca
     return K
 
 
+@cython.boundscheck(False)
+cpdef pairwise_path_distance(np.ndarray[np.int_t, ndim=2] P1,
+                             np.ndarray[np.int_t, ndim=1] L1,
+                             np.ndarray[np.int_t, ndim=2] P2,
+                             np.ndarray[np.int_t, ndim=1] L2):
+    """Prefix distance between all pairs of padded paths.
+
+    P1 (N1, max_len) and P2 (N2, max_len) contain one path per row, padded
+    at the end; L1 and L2 hold the true path lengths.
+    """
+    cdef int N1 = P1.shape[0]
+    cdef int N2 = P2.shape[0]
+    cdef np.ndarray[np.double_t, ndim=2] D = np.empty((N1, N2))
+    cdef int i, j, k, n, d
+    for i in range(N1):
+        for j in range(N2):
+            if L1[i] < L2[j]:
+                n = L1[i]
+                d = L2[j]
+            else:
+                n = L2[j]
+                d = L1[i]
+            k = 0
+            while k < n and P1[i, k] == P2[j, k]:
+                k += 1
+            D[i, j] = d - k
+    return D
+
+
 cpdef min_dist_complete(np.ndarray[np.double_t, ndim=2] D):
     cdef np.ndarray[np.double_t, ndim=2] R = D.copy()
     cdef int N = D.shape[0]
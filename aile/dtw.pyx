@@ -85,3 +85,10 @@ cpdef match(np.ndarray[np.int_t, ndim=1] s,
                 s[k] = -1
             k += 1
     return s
+
+
+cpdef match_from_distance(np.ndarray[np.double_t, ndim=2] D):
+    """Run the whole DTW pipeline (from_distance, path, match) on a single
+    distance matrix and return the match"""
+    s, t = path(from_distance(D))
+    return match(s, t, D)
@@ -2,38 +2,14 @@ import collections
 import itertools
 
 import numpy as np
+import scipy.sparse
 import sklearn.cluster
 import networkx as nx
-import scrapely.htmlpage as hp
 
 import _kernel as _ker
 import dtw
 
 
-def to_rows(d):
-    """Make a square matrix with rows equal to 'd'.
-
-    >>> print to_rows(np.array([1,2,3,4]))
-    [[1 2 3 4]
-     [1 2 3 4]
-     [1 2 3 4]
-     [1 2 3 4]]
-     """
-    return np.tile(d, (len(d), 1))
-
-
-def to_cols(d):
-    """Make a square matrix with columns equal to 'd'.
-
-    >>> print ker.to_cols(np.array([1,2,3,4]))
-    [[1 1 1 1]
-     [2 2 2 2]
-     [3 3 3 3]
-     [4 4 4 4]]
-    """
-    return np.tile(d.reshape(len(d), -1), (1, len(d)))
-
-
 def normalize_kernel(K):
     """New kernel with unit diagonal.
 
@@ -41,7 +17,7 @@ def normalize_kernel(K):
     """
     d = np.diag(K).copy()
     d[d == 0] = 1.0
-    return K/np.sqrt(to_rows(d)*to_cols(d))
+    return K/np.sqrt(d[None, :]*d[:, None])
 
 
 def kernel_to_distance(K):
@@ -51,9 +27,28 @@ def kernel_to_distance(K):
         |u - v|^2 = (u - v)(u - v) = u^2 + v^2 - 2uv
     """
     d = np.diag(K)
-    D = to_rows(d) + to_cols(d) - 2*K
-    D[D < 0] = 0.0 # numerical error can make D go a little below 0
-    return np.sqrt(D)
+    D = np.empty_like(K)
+    np.add(d[None, :], d[:, None], out=D)
+    D -= 2*K
+    np.maximum(D, 0.0, out=D) # numerical error can make D go a little below 0
+    return np.sqrt(D, out=D)
+
+
+def normalized_kernel_to_distance(K):
+    """Build a distance matrix from the kernel, normalizing it on the fly.
+
+    Equivalent to kernel_to_distance(normalize_kernel(K)) but since the
+    normalized kernel has unit diagonal the distance collapses to:
+        |u - v|^2 = 2 - 2*K'[u, v]
+    and we can fuse both passes over the matrix, reusing a single buffer.
+    """
+    d = np.sqrt(np.diag(K)).copy()
+    d[d == 0] = 1.0
+    D = np.divide(K, d[None, :]*d[:, None])
+    D *= -2.0
+    D += 2.0
+    np.maximum(D, 0.0, out=D) # numerical error can make D go a little below 0
+    return np.sqrt(D, out=D)
 
 
 def tree_size_distance(page_tree):
@@ -67,22 +62,23 @@ def tree_size_distance(page_tree):
     Then:
         0 <= |T1 - T2| < 1
     """
-    s = page_tree.tree_size()
-    a = to_cols(s).astype(float)
-    b = to_rows(s).astype(float)
+    s = page_tree.tree_size().astype(float)
+    a = s[:, None]
+    b = s[None, :]
     return np.abs(a - b)/(a + b)
 
 
 def must_separate(nodes, page_tree):
     """Given a sequence of nodes and a PageTree return a list of pairs
     of nodes such that one is the ascendant/descendant of the other"""
+    span_end = page_tree.span_end
+    nodes = np.asarray(nodes)
     separate = []
-    for src in nodes:
-        m = page_tree.match[src]
-        if m >= 0:
-            for tgt in range(src+1, m):
-                if tgt in nodes:
-                    separate.append((src, tgt))
+    # Only nodes with a non-trivial subtree can cover another node
+    for src in nodes[span_end[nodes] > nodes + 1]:
+        lo, hi = np.searchsorted(nodes, (src + 1, span_end[src]))
+        for tgt in nodes[lo:hi]:
+            separate.append((src, tgt))
     return separate
 
 
@@ -91,18 +87,59 @@ def cut_descendants(D, nodes, page_tree):
     perform a multicut of the complete graph of nodes separating
     the nodes that are descendant/ascendants of each other according to the
     PageTree"""
+    nodes = np.asarray(nodes)
+    if np.all(page_tree.span_len[nodes] <= 1):
+        # All nodes are leaves: no pair to separate
+        return [nodes]
     index = {node: i for i, node in enumerate(nodes)}
     separate = [(index[i], index[j])
                 for i, j in must_separate(nodes, page_tree)]
     if separate:
-        D = D[nodes, :][:, nodes].copy()
+        D = D[np.ix_(nodes, nodes)]
+        k = len(nodes)
+        forbidden = np.zeros((k, k), dtype=bool)
         for i, j in separate:
-            D[i, j] = D[j, i] = np.inf
-        E = _ker.min_dist_complete(D)
-        eps = min(E[i,j] for i, j in separate)
-        components = nx.connected_components(
-            nx.Graph((nodes[i], nodes[j])
-                     for (i, j) in zip(*np.nonzero(E < eps))))
+            forbidden[i, j] = forbidden[j, i] = True
+        ii, jj = np.triu_indices(k, 1)
+        allowed = ~forbidden[ii, jj]
+        ii = ii[allowed]
+        jj = jj[allowed]
+        w = D[ii, jj]
+        order = np.argsort(w, kind='mergesort')
+        ii = ii[order]
+        jj = jj[order]
+        w = w[order]
+        parent = np.arange(k)
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        def union(a, b):
+            parent[find(a)] = find(b)
+        # Grow a single-linkage forest edge by edge (Kruskal); the first
+        # weight at which a must-separate pair gets joined is the
+        # bottleneck threshold of the multicut
+        eps = np.inf
+        pos = 0
+        n_edges = len(w)
+        while pos < n_edges:
+            end = pos
+            while end < n_edges and w[end] == w[pos]:
+                union(ii[end], jj[end])
+                end += 1
+            if any(find(a) == find(b) for a, b in separate):
+                eps = w[pos]
+                break
+            pos = end
+        # Emit the components connected strictly below the threshold
+        parent[:] = np.arange(k)
+        for e in range(n_edges):
+            if not w[e] < eps:
+                break
+            union(ii[e], jj[e])
+        roots = np.array([find(x) for x in range(k)])
+        components = [nodes[roots == r] for r in np.unique(roots)]
     else:
         components = [nodes]
     return components
@@ -111,18 +148,41 @@ def cut_descendants(D, nodes, page_tree):
 def labels_to_clusters(labels):
     """Given a an assignment of cluster label to each item return the a list
     of sets, where each set is a cluster"""
-    return [np.flatnonzero(labels==label) for label in range(np.max(labels)+1)]
+    order = np.argsort(labels, kind='mergesort')
+    order = order[labels[order] != -1]
+    starts = np.searchsorted(labels[order], np.arange(np.max(labels) + 2))
+    return [order[starts[label]:starts[label+1]]
+            for label in range(np.max(labels) + 1)]
 
 
 def clusters_to_labels(clusters, n_samples):
     """Given a list with clusters label each item"""
     labels = np.repeat(-1, n_samples)
-    for i, c in enumerate(clusters):
-        for j in c:
-            labels[j] = i
+    if clusters:
+        idx = np.concatenate([np.asarray(c, dtype=int) for c in clusters])
+        labels[idx] = np.repeat(
+            np.arange(len(clusters)), [len(c) for c in clusters])
     return labels
 
 
+def radius_neighbors_graph(D, eps, chunk_size=256):
+    """Build a sparse matrix with the entries of the dense distance matrix 'D'
+    that are within 'eps', thresholding in row chunks so that only the
+    neighborhoods are ever materialized"""
+    rows = []
+    cols = []
+    data = []
+    for start in range(0, D.shape[0], chunk_size):
+        chunk = D[start:start + chunk_size]
+        i, j = np.nonzero(chunk <= eps)
+        rows.append(i + start)
+        cols.append(j)
+        data.append(chunk[i, j])
+    return scipy.sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=D.shape)
+
+
 def boost(d, k=2):
     """Given a distance between 0 and 1 make it more nonlinear"""
     return 1 - (1 - d)**k
@@ -161,12 +221,17 @@ class TreeClustering(object):
         np.array
             A label for each sample
         """
-        Y = boost(tree_size_distance(self.page_tree), 2)
-        D = d1*X + d2*Y
+        # boost(Y, 2) == Y*(2 - Y), folded into D = d1*X + d2*boost(Y)
+        # with in-place ops to avoid a temporary per ufunc
+        Y = tree_size_distance(self.page_tree)
+        D = np.subtract(2.0, Y)
+        D *= Y
+        D *= d2
+        D += d1*X
         clt = sklearn.cluster.DBSCAN(
             eps=eps, min_samples=min_cluster_size, metric='precomputed')
         self.clusters = []
-        for c in labels_to_clusters(clt.fit_predict(D)):
+        for c in labels_to_clusters(clt.fit_predict(radius_neighbors_graph(D, eps))):
             if len(c) >= min_cluster_size:
                 if separate_descendants:
                     self.clusters += filter(lambda x: len(x) >= min_cluster_size,
@@ -187,7 +252,7 @@ def cluster(page_tree, K, eps=1.2, d1=1.0, d2=0.1, separate_descendants=True):
         is an outlier (it isn't part of any cluster).
     """
     return TreeClustering(page_tree).fit_predict(
-        kernel_to_distance(normalize_kernel(K)),
+        normalized_kernel_to_distance(K),
         eps=eps, d1=d1, d2=d2,
         separate_descendants=separate_descendants)
 
@@ -195,43 +260,60 @@ def cluster(page_tree, K, eps=1.2, d1=1.0, d2=0.1, separate_descendants=True):
 def clusters_tournament(ptree, labels):
     """A cluster 'wins' if some node inside the cluster is the ascendant
     of another node in the other cluster"""
+    N = len(ptree.match)
     L = np.max(labels) + 1
+    # C[k, l]: number of nodes before position 'k' labeled 'l'
+    C = np.zeros((N + 1, L), dtype=int)
+    valid = np.flatnonzero(labels != -1)
+    C[valid + 1, labels[valid]] = 1
+    np.cumsum(C, axis=0, out=C)
+    # Node 'i' covers all nodes before the end of its subtree
     T = np.zeros((L, L), dtype=int)
-    for i, m in enumerate(ptree.match):
-        li = labels[i]
-        if li != -1:
-            for j in range(max(i + 1, m)):
-                lj = labels[j]
-                if lj != -1:
-                    T[li, lj] += 1
+    np.add.at(T, labels[valid], C[ptree.span_end[valid]])
     return T
 
 
-def _make_acyclic(T, labels):
-    """See https://en.wikipedia.org/wiki/Feedback_arc_set"""
-    n = T.shape[0]
-    if n == 0:
-        return []
-    i = np.random.randint(0, n)
-    L = []
-    R = []
-    for j in range(n):
-        if j != i:
-            if T[i, j] > T[j, i]:
-                R.append(j)
-            else:
-                L.append(j)
-    return (make_acyclic(T[L, :][:, L], labels[L]) +
-            [labels[i]] +
-            make_acyclic(T[R, :][:, R], labels[R]))
-
-
 def make_acyclic(T, labels=None):
-    """Tiven a tournament T, try to rank the clusters in a consisten
-    way"""
+    """Given a tournament T, try to rank the clusters in a consistent
+    way (winners first, as few backward arcs as possible).
+
+    Greedy heuristic for the feedback arc set problem from:
+        P. Eades, X. Lin, W.F. Smyth,
+        'A fast and effective heuristic for the feedback arc set problem'
+    Sinks are repeatedly moved to the back of the ranking, sources to
+    the front, and when neither exists the vertex with maximum
+    outdegree - indegree goes to the front.
+    """
     if labels is None:
         labels = np.arange(T.shape[0])
-    return _make_acyclic(T, labels)
+    A = T > T.T
+    np.fill_diagonal(A, False)
+    outdeg = A.sum(axis=1)
+    indeg = A.sum(axis=0)
+    alive = np.ones(T.shape[0], dtype=bool)
+    n_alive = T.shape[0]
+    front = []
+    back = []
+    def remove(v):
+        alive[v] = False
+        outdeg[alive & A[:, v]] -= 1
+        indeg[alive & A[v, :]] -= 1
+    while n_alive > 0:
+        sinks = np.flatnonzero(alive & (outdeg == 0))
+        if len(sinks) > 0:
+            v = sinks[0]
+            back.append(v)
+        else:
+            sources = np.flatnonzero(alive & (indeg == 0))
+            if len(sources) > 0:
+                v = sources[0]
+            else:
+                delta = np.where(alive, outdeg - indeg, np.min(outdeg - indeg) - 1)
+                v = np.argmax(delta)
+            front.append(v)
+        remove(v)
+        n_alive -= 1
+    return [labels[v] for v in front] + [labels[v] for v in reversed(back)]
 
 
 def separate_clusters(ptree, labels):
@@ -239,9 +321,10 @@ def separate_clusters(ptree, labels):
     ranking = make_acyclic(clusters_tournament(ptree, labels))
     clusters = labels_to_clusters(labels)
     labels = labels.copy()
+    span_end = ptree.span_end
     for i in ranking:
         for node in clusters[i]:
-            labels[node+1:max(node+1, ptree.match[node])] = -1
+            labels[node+1:span_end[node]] = -1
     return labels
 
 
@@ -252,15 +335,11 @@ def score_cluster(ptree, cluster, k=4):
         return 0.0
     D = sklearn.neighbors.kneighbors_graph(
         ptree.distance[cluster, :][:, cluster], min(len(cluster) - 1, k),
-        metric='precomputed', mode='distance')
-    score = 0.0
-    for i, j in zip(*D.nonzero()):
-        a = cluster[i]
-        b = cluster[j]
-        si = max(a+1, ptree.match[a]) - a
-        sj = max(b+1, ptree.match[b]) - b
-        score += min(si, sj)/D[i, j]**2
-    return score
+        metric='precomputed', mode='distance').tocoo()
+    span_len = ptree.span_len
+    si = span_len[cluster[D.row]]
+    sj = span_len[cluster[D.col]]
+    return float(np.sum(np.minimum(si, sj)/D.data**2))
 
 
 def some_root_has_label(labels, item, label):
@@ -279,10 +358,14 @@ def extract_items_with_label(ptree, labels, label_to_extract):
     List[tuple]
         Where each tuple is the roots of the extracted subtrees.
     """
+    match = ptree.match
+    children_flat = ptree.children_flat
+    children_indptr = ptree.children_indptr
+    is_tag = ptree.is_tag
     items = []
     i = 0
     while i < len(labels):
-        children = ptree.children(i)
+        children = children_flat[children_indptr[i]:children_indptr[i+1]]
         if np.any(labels[children] == label_to_extract):
             first = None
             item = []
@@ -296,11 +379,11 @@ def extract_items_with_label(ptree, labels, label_to_extract):
                             items.append(tuple(item))
                             item = []
                     # Only append tags as item roots
-                    if isinstance(ptree.page.parsed_body[ptree.index[c]], hp.HtmlTag):
+                    if is_tag[c]:
                         item.append(c)
             if item:
                 items.append(tuple(item))
-            i = ptree.match[i]
+            i = match[i]
         else:
             i += 1
     return filter(lambda item: some_root_has_label(labels, item, label_to_extract),
@@ -309,8 +392,7 @@ def extract_items_with_label(ptree, labels, label_to_extract):
 
 def vote(sequence):
     """Return the most frequent item in sequence"""
-    return max(collections.Counter(sequence).iteritems(),
-               key=lambda kv: kv[1])[0]
+    return int(np.bincount(np.fromiter(sequence, dtype=int)).argmax())
 
 
 def regularize_item_length(ptree, labels, item_locations, max_items_cut_per=0.33):
@@ -325,14 +407,16 @@ def regularize_item_length(ptree, labels, item_locations, max_items_cut_per=0.33
     item_locations = filter(lambda x: len(x) >= min_item_length,
                             item_locations)
     if cut_items > 0:
-        label_count = collections.Counter(
-            labels[root] for item_location in item_locations
-            for root in item_location)
+        flat_roots = np.fromiter(
+            (root for item_location in item_locations
+             for root in item_location), dtype=int)
+        # Shift by one so the -1 (outlier) label can be counted too
+        label_count = np.bincount(labels[flat_roots] + 1)
         new_item_locations = []
         for item_location in item_locations:
             if len(item_location) > min_item_length:
                 scored = sorted(
-                    ((label_count[labels[root]], root) for root in item_location),
+                    ((label_count[labels[root] + 1], root) for root in item_location),
                     reverse=True)
                 keep = set(x[1] for x in scored[:min_item_length])
                 new_item_location = tuple(
@@ -389,42 +473,92 @@ def path_distance(path_1, path_2):
     return d
 
 
+def pack_paths(path_seq, length, fill):
+    """Stack a sequence of paths into a (n_paths, length) matrix, padding
+    short paths with 'fill'"""
+    P = np.full((len(path_seq), length), fill, dtype=int)
+    for i, path in enumerate(path_seq):
+        P[i, :len(path)] = path
+    return P
+
+
 def pairwise_path_distance(path_seq_1, path_seq_2):
     """Compute all pairwise distances between paths in path_seq_1 and
     path_seq_2"""
-    N1 = len(path_seq_1)
-    N2 = len(path_seq_2)
-    D = np.zeros((N1, N2))
-    for i in range(N1):
-        q1 = path_seq_1[i]
-        for j in range(N2):
-            D[i, j] = path_distance(q1, path_seq_2[j])
-    return D
+    L1 = np.array([len(path) for path in path_seq_1])
+    L2 = np.array([len(path) for path in path_seq_2])
+    length = max(np.max(L1), np.max(L2))
+    P1 = pack_paths(path_seq_1, length, -1)
+    P2 = pack_paths(path_seq_2, length, -1)
+    return _ker.pairwise_path_distance(P1, L1, P2, L2)
 
 
 def extract_path_seq_1(ptree, item):
-    paths = []
+    """Pack the paths going upwards from the nodes covered by 'item'
+    into (leaves, indptr, flat) arrays, where the nodes of the i-th path
+    are flat[indptr[i]:indptr[i+1]] and leaves[i] is its starting node"""
+    leaves = []
+    indptr = [0]
+    flat = []
     for root in item:
         for path in ptree.prefixes_at(root):
-            paths.append((path[0], path))
-    return paths
+            leaves.append(path[0])
+            flat.extend(path)
+            indptr.append(len(flat))
+    return np.array(leaves), np.array(indptr), np.array(flat)
 
 
 def extract_path_seq(ptree, items):
-    all_paths = []
-    for item in items:
-        paths = extract_path_seq_1(ptree, item)
-        all_paths.append(paths)
-    return all_paths
+    return [extract_path_seq_1(ptree, item) for item in items]
 
 
-def map_paths_1(func, paths):
-    return [(leaf, [func(node) for node in path])
-            for leaf, path in paths]
+def pack_paths_csr(indptr, flat, length):
+    """Stack the CSR paths (indptr, flat) into a (n_paths, length) matrix,
+    padding short paths with -1"""
+    lens = np.diff(indptr)
+    P = np.full((len(lens), length), -1, dtype=int)
+    rows = np.repeat(np.arange(len(lens)), lens)
+    cols = np.arange(len(flat)) - np.repeat(indptr[:-1], lens)
+    P[rows, cols] = flat
+    return P
 
 
-def map_paths(func, paths):
-    return [map_paths_1(func, path_set) for path_set in paths]
+def _iter_bits(mask):
+    """Iterate over the indices of the set bits of 'mask'"""
+    while mask:
+        b = mask & -mask
+        mask ^= b
+        yield b.bit_length() - 1
+
+
+def _bit_count(mask):
+    """Number of set bits of 'mask'"""
+    return bin(mask).count('1')
+
+
+def bron_kerbosch(adj):
+    """Enumerate all maximal cliques of the graph given as a list of
+    neighborhood bitmasks. Each clique is returned as a bitmask.
+
+    Iterative Bron-Kerbosch with pivoting: the pivot is the vertex of
+    P | X with most neighbors in P and only non-neighbors of the pivot
+    are expanded, so every set operation is a single big-int op.
+    """
+    cliques = []
+    stack = [(0, (1 << len(adj)) - 1, 0)] if adj else []
+    while stack:
+        R, P, X = stack.pop()
+        if P == 0:
+            if X == 0:
+                cliques.append(R)
+            continue
+        u = max(_iter_bits(P | X), key=lambda v: _bit_count(P & adj[v]))
+        for v in _iter_bits(P & ~adj[u]):
+            b = 1 << v
+            stack.append((R | b, P & adj[v], X & adj[v]))
+            P &= ~b
+            X |= b
+    return cliques
 
 
 def find_cliques(G, min_size):
@@ -437,35 +571,49 @@ def find_cliques(G, min_size):
     dict
         Mapping nodes to clique ID
     """
-    cliques = []
-    for K in nx.find_cliques(G):
-        if len(K) >= min_size:
-            cliques.append(set(K))
-    cliques.sort(reverse=True, key=lambda x: len(x))
-    L = set()
-    for K in cliques:
-        K -= L
-        L |= K
-    cliques = [J for J in cliques if len(J) >= min_size]
+    nodes = sorted(G.nodes())
+    index = {node: i for i, node in enumerate(nodes)}
+    adj = [0]*len(nodes)
+    for u, v in G.edges():
+        if u != v:
+            adj[index[u]] |= 1 << index[v]
+            adj[index[v]] |= 1 << index[u]
+    cliques = [K for K in bron_kerbosch(adj) if _bit_count(K) >= min_size]
+    cliques.sort(reverse=True, key=_bit_count)
+    placed = 0
     node_to_clique = {}
-    for i, K in enumerate(cliques):
-        for node in K:
-            if node not in node_to_clique:
-                node_to_clique[node] = i
+    n_cliques = 0
+    for K in cliques:
+        K &= ~placed
+        placed |= K
+        if _bit_count(K) >= min_size:
+            for v in _iter_bits(K):
+                node_to_clique[nodes[v]] = n_cliques
+            n_cliques += 1
     return node_to_clique
 
 
 def match_graph(all_paths):
     """Build a graph where n1 and n2 share an edge if they have
-    been matched using DTW"""
+    been matched using DTW.
+
+    'all_paths' holds one (leaves, indptr, flat) triple per item, as
+    returned by extract_path_seq"""
+    lens = [np.diff(indptr) for _, indptr, _ in all_paths]
+    length = max(np.max(l) for l in lens)
+    P = np.vstack([pack_paths_csr(indptr, flat, length)
+                   for _, indptr, flat in all_paths])
+    L = np.concatenate(lens)
+    offset = np.cumsum([0] + [len(l) for l in lens])
+    # One launch for all pairwise path distances, sliced per item pair
+    D = _ker.pairwise_path_distance(P, L, P, L)
     G = nx.Graph()
-    for path_set_1, path_set_2 in itertools.combinations(all_paths, 2):
-        n1, p1 = zip(*path_set_1)
-        n2, p2 = zip(*path_set_2)
-        D = pairwise_path_distance(p1, p2)
-        DTW = dtw.from_distance(D)
-        a1, a2 = dtw.path(DTW)
-        m = dtw.match(a1, a2, D)
+    all_leaves = [leaves for leaves, _, _ in all_paths]
+    for a, b in itertools.combinations(range(len(all_paths)), 2):
+        n1 = all_leaves[a]
+        n2 = all_leaves[b]
+        m = dtw.match_from_distance(
+            D[offset[a]:offset[a+1], offset[b]:offset[b+1]])
         for i, j in enumerate(m):
             if j != -1:
                 G.add_edge(n1[i], n2[j])
@@ -473,26 +621,28 @@ def match_graph(all_paths):
 
 
 def align_items(ptree, items, node_to_clique):
+    span_end = ptree.span_end
     n_cols = max(node_to_clique.values()) + 1
+    node_clique = np.repeat(-1, len(span_end))
+    for node, clique in node_to_clique.iteritems():
+        node_clique[node] = clique
     table = np.zeros((len(items), n_cols), dtype=int) - 1
     for i, item in enumerate(items):
-        for root in item:
-            for c in range(root, max(root + 1, ptree.match[root])):
-                try:
-                    table[i, node_to_clique[c]] = c
-                except KeyError:
-                    pass
+        nodes = np.concatenate(
+            [np.arange(root, span_end[root]) for root in item])
+        cols = node_clique[nodes]
+        valid = cols != -1
+        table[i, cols[valid]] = nodes[valid]
     return table
 
 
 def extract_item_table(ptree, items, labels):
+    all_paths = [(leaves, indptr, labels[flat])
+                 for leaves, indptr, flat in extract_path_seq(ptree, items)]
     return align_items(
         ptree,
         items,
-        find_cliques(
-            match_graph(map_paths(
-                lambda x: labels[x], extract_path_seq(ptree, items))),
-            0.5*len(items))
+        find_cliques(match_graph(all_paths), 0.5*len(items))
     )
 
 
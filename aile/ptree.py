@@ -103,6 +103,9 @@ class PageTree(object):
         index, self.nodes = zip(*tree_nodes(page))
         self.index = np.array(index)
         self.n_nodes = len(self.nodes)
+        self.is_tag = np.fromiter(
+            (is_tag(page.parsed_body[i]) for i in self.index),
+            dtype=bool, count=self.n_nodes)
         self.reverse_index = np.repeat(-1, len(page.parsed_body))
         for i, idx in enumerate(self.index):
             self.reverse_index[idx] = i
@@ -127,6 +130,10 @@ class PageTree(object):
         for i, m in enumerate(self.match):
             self.parents[i+1:m] = i
 
+        # End of the subtree of each node and number of nodes within
+        self.span_end = np.maximum(np.arange(self.n_nodes) + 1, self.match)
+        self.span_len = self.span_end - np.arange(self.n_nodes)
+
         self.n_children = np.zeros((self.n_nodes,), dtype=int)
         self.i_child = np.zeros((self.n_nodes,), dtype=int)
         for i, p in enumerate(self.parents):
@@ -135,12 +142,20 @@ class PageTree(object):
                 self.n_children[p] += 1
         self.max_childs = np.max(self.n_children)
 
+        # CSR-style children index: the children of node 'i' are
+        # children_flat[children_indptr[i]:children_indptr[i+1]]
+        has_parent = np.flatnonzero(self.parents >= 0)
+        self.children_flat = has_parent[
+            np.argsort(self.parents[has_parent], kind='mergesort')]
+        self.children_indptr = np.zeros((self.n_nodes + 1,), dtype=int)
+        np.cumsum(self.n_children, out=self.children_indptr[1:])
+
         self.distance = np.ones((self.n_nodes, self.n_nodes), dtype=int)
         for i in range(self.n_nodes - 1, -1, -1):
             self.distance[i, i] = 0
             for a, b in itertools.combinations(self.children(i), 2):
-                for j in range(a, max(a + 1, self.match[a])):
-                    for k in range(b, max(b + 1, self.match[b])):
+                for j in range(a, self.span_end[a]):
+                    for k in range(b, self.span_end[b]):
                         self.distance[j, k] = self.distance[j, a] + 2 + self.distance[b, k]
                         self.distance[k, j] = self.distance[j, k]
 
@@ -150,7 +165,7 @@ class PageTree(object):
 
     def children(self, i):
         """An array with the indices of the direct children of node 'i'"""
-        return i + 1 + np.flatnonzero(self.parents[i+1:max(i+1, self.match[i])] == i)
+        return self.children_flat[self.children_indptr[i]:self.children_indptr[i+1]]
 
     def children_matrix(self, max_childs=None):
         """A matrix of shape (len(tree), max_childs) where row 'i' contains the
@@ -189,15 +204,13 @@ class PageTree(object):
         """A list of paths going upwards that start at a descendant of 'i' and
         end at a 'i'"""
         paths = []
-        for j in range(i, max(i+1, self.match[i])):
+        for j in range(i, self.span_end[i]):
             paths.append(self.prefix(j, i))
         return paths
 
     def tree_size(self):
         """Return an array where the i-th entry is the size of subtree 'i'"""
-        r = np.arange(len(self.match))
-        s = r + 1
-        return np.where(s > self.match, s, self.match) - r
+        return self.span_len
 
     def fragment_index(self, tree_index):
         """Convert from tree node numbering to original fragment numbers"""
@@ -206,7 +219,7 @@ class PageTree(object):
 
     def is_descendant(self, parent, descendant):
         return descendant >= parent and \
-            descendant < max(parent + 1, self.match[parent])
+            descendant < self.span_end[parent]
 
     def common_ascendant(self, nodes):
         s = set(range(self.n_nodes))